@@ -0,0 +1,262 @@
+"""Helpers shared by the infini_craft servers.
+
+Holds the FastAPI app setup used by both `server` and `server_groq`, plus
+the Groq prompts, response schemas and parsers.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+from functools import cache
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import AsyncContextManager, Callable, List
+
+import orjson
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel, ConfigDict, Field
+
+# -----------------------------------------------------------------------------
+# Configuration helpers
+# -----------------------------------------------------------------------------
+
+@cache
+def load_api_key() -> str:
+    """Return Groq API key.
+
+    Looks for a file named `groq_api_key.txt` in the same directory as this script.
+    Fallback to `GROQ_API_KEY` env var if the file is missing or empty.
+    The file should contain only the plain API key string with no extra whitespace.
+    The result is cached so the file is only read once per process.
+    """
+    cfg_path = Path(__file__).with_name("groq_api_key.txt")
+    if cfg_path.exists():
+        key = cfg_path.read_text(encoding="utf-8").strip()
+        if key:
+            return key
+    return os.getenv("GROQ_API_KEY", "")
+
+
+Lifespan = Callable[[FastAPI], AsyncContextManager[None]]
+
+
+@cache
+def setup_logging() -> None:
+    """Send `infini_craft.*` log records to stderr from a background thread.
+
+    Request handlers only put records on a queue, so a slow stderr never
+    blocks the event loop. The level comes from `INFINI_CRAFT_LOG_LEVEL`
+    (default INFO; use DEBUG to see every model response).
+    """
+    records: queue.Queue = queue.Queue(-1)
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    listener = QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    log = logging.getLogger("infini_craft")
+    log.addHandler(QueueHandler(records))
+    log.setLevel(os.getenv("INFINI_CRAFT_LOG_LEVEL", "INFO").upper())
+    log.propagate = False
+
+
+# -----------------------------------------------------------------------------
+# FastAPI boilerplate
+# -----------------------------------------------------------------------------
+
+# Frontends allowed to call the API: the Vite dev server and the deployed
+# site. Override with a comma-separated INFINI_CRAFT_CORS_ORIGINS, or set
+# DEV=1 to allow any origin.
+CORS_ORIGINS = os.getenv(
+    "INFINI_CRAFT_CORS_ORIGINS",
+    "http://localhost:5173,http://127.0.0.1:5173,https://infini-craft.com",
+).split(",")
+
+
+def create_app(lifespan: Lifespan | None = None) -> FastAPI:
+    """Return a FastAPI app with the CORS policy the UI needs.
+
+    Responses are serialized with orjson, which writes bytes directly.
+    `lifespan` is passed through to FastAPI for startup/shutdown work.
+    """
+    setup_logging()
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"] if os.getenv("DEV") else CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["content-type", "x-client-id"],
+    )
+    return app
+
+
+# -----------------------------------------------------------------------------
+# Response schemas
+# -----------------------------------------------------------------------------
+# Passed to Groq as a JSON schema so the model can only emit objects of this
+# shape.
+
+class AddResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    symbol: str
+    emoji: str
+
+
+class SplitResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    parts: List[AddResult] = Field(min_length=2, max_length=2)
+
+
+def _response_format(name: str, schema: type[BaseModel]) -> dict:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "schema": schema.model_json_schema(),
+            "strict": True,
+        },
+    }
+
+
+class AddBatchItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    symbols: List[str]
+    symbol: str
+    emoji: str
+
+
+class AddBatchResult(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    results: List[AddBatchItem]
+
+
+ADD_RESPONSE_FORMAT = _response_format("add", AddResult)
+ADD_BATCH_RESPONSE_FORMAT = _response_format("add_batch", AddBatchResult)
+SPLIT_RESPONSE_FORMAT = _response_format("split", SplitResult)
+
+# -----------------------------------------------------------------------------
+# Prompts
+# -----------------------------------------------------------------------------
+# Prompt templates are built once at import; each call only fills in the
+# symbols. The system message is shared between calls because nothing
+# mutates it.
+_SYSTEM_MESSAGE = {"role": "system", "content": "You are an API that returns JSON."}
+
+_ADD_USER_TEMPLATE = '''Combine the following symbols: {joined}
+
+Return a single JSON object with two keys: "symbol" and "emoji". Do not add any other text.
+
+Example for "Water" + "Fire":
+{{
+  "symbol": "Steam",
+  "emoji": "💨"
+}}'''
+
+_ADD_BATCH_USER_TEMPLATE = '''Combine each of the following groups of symbols:
+{numbered}
+
+Return a single JSON object with one key: "results". The value should be a list with exactly one object per group, in the same order, each with "symbols", "symbol" and "emoji" keys. "symbols" repeats the group's input symbols exactly as given. Do not add any other text.
+
+Example for "1. Water+Fire" and "2. Earth+Water":
+{{
+  "results": [
+    {{
+      "symbols": ["Water", "Fire"],
+      "symbol": "Steam",
+      "emoji": "💨"
+    }},
+    {{
+      "symbols": ["Earth", "Water"],
+      "symbol": "Mud",
+      "emoji": "🟫"
+    }}
+  ]
+}}'''
+
+_SPLIT_USER_TEMPLATE = '''Split the following symbol into two parts: {symbol}
+
+Return a single JSON object with one key: "parts". The value should be a list of two objects, each with "symbol" and "emoji" keys. Do not add any other text.
+
+Example for "Steam":
+{{
+  "parts": [
+    {{
+      "symbol": "Water",
+      "emoji": "💧"
+    }},
+    {{
+      "symbol": "Fire",
+      "emoji": "🔥"
+    }}
+  ]
+}}'''
+
+
+def create_add_prompt(symbols: List[str]) -> List[dict]:
+    """Prompt Groq to combine symbols and return JSON {"symbol": str, "emoji": str}."""
+    user_msg = _ADD_USER_TEMPLATE.format(joined="+".join(symbols))
+    return [_SYSTEM_MESSAGE, {"role": "user", "content": user_msg}]
+
+
+def create_add_batch_prompt(pairs: List[tuple[str, ...]]) -> List[dict]:
+    """Prompt Groq to combine several symbol groups in one call and return JSON {"results": [{symbol, emoji}, ...]}."""
+    numbered = "\n".join(
+        f"{i}. {'+'.join(symbols)}" for i, symbols in enumerate(pairs, start=1)
+    )
+    user_msg = _ADD_BATCH_USER_TEMPLATE.format(numbered=numbered)
+    return [_SYSTEM_MESSAGE, {"role": "user", "content": user_msg}]
+
+
+def create_split_prompt(symbol: str) -> List[dict]:
+    """Prompt Groq to split a symbol and return JSON {"parts": [ {symbol, emoji}, {symbol, emoji} ]}."""
+    user_msg = _SPLIT_USER_TEMPLATE.format(symbol=symbol)
+    return [_SYSTEM_MESSAGE, {"role": "user", "content": user_msg}]
+
+
+# -----------------------------------------------------------------------------
+# Response parsers
+# -----------------------------------------------------------------------------
+# The schemas above constrain the model's output, so the replies are parsed
+# with orjson and read directly rather than rebuilt through Pydantic. A reply
+# of the wrong shape raises KeyError/TypeError/ValueError, which the callers
+# already treat as a failed request.
+
+def _symbol_emoji(item: dict) -> dict:
+    return {"symbol": item["symbol"], "emoji": item["emoji"]}
+
+
+def parse_add_response(text: str) -> dict:
+    """Parse a schema-constrained add response into {"symbol", "emoji"}."""
+    return _symbol_emoji(orjson.loads(text))
+
+
+def parse_split_response(text: str) -> List[dict]:
+    """Parse a schema-constrained split response into two {"symbol", "emoji"} dicts."""
+    parts = orjson.loads(text)["parts"]
+    if len(parts) != 2:
+        raise ValueError(f"expected 2 parts, got {len(parts)}")
+    return [_symbol_emoji(part) for part in parts]
+
+
+def parse_add_batch_response(text: str) -> List[tuple[tuple[str, ...], dict]]:
+    """Parse a schema-constrained batch add response into (input symbols, {"symbol", "emoji"}) pairs.
+
+    The model echoes each group's input symbols so callers can match results
+    to groups instead of trusting list order.
+    """
+    return [
+        (tuple(result["symbols"]), _symbol_emoji(result))
+        for result in orjson.loads(text)["results"]
+    ]
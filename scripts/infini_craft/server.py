@@ -1,53 +1,60 @@
-from functools import lru_cache
+from contextlib import asynccontextmanager
+from functools import cache, lru_cache
+import logging
 import os
-import traceback
+import re
 from typing import Annotated, List
-from fastapi import FastAPI, Query
+from fastapi import Query
 
-from fastapi.middleware.cors import CORSMiddleware
-from exllamav2 import (
-    ExLlamaV2,
-    ExLlamaV2Config,
-    ExLlamaV2Cache,
-    ExLlamaV2Tokenizer,
-    ExLlamaV2Lora,
-)
+from infini_craft._common import create_app
 
- import (
-    ExLlamaV2BaseGenerator,
-    ExLlamaV2StreamingGenerator,
-    ExLlamaV2Sampler
-)
+MODEL_PATH = "../models/Llama-2-7B-Chat-GPTQ"
+LORA_SPLIT_PATH = "../loras/infini_craft/infini_craft_llama7b_gptq_lora_split"
+LORA_ADD_PATH = "../loras/infini_craft/infini_craft_llama7b_gptq_lora_add"
 
+log = logging.getLogger(__name__)
 
 
-# Groq client setup
-client = OpenAI(
-    base_url="https://api.groq.com/openai/v1",
-    api_key=os.getenv("GROQ_API_KEY", "")
-)
-MODEL_NAME = "qwen3-32B"
-
-app = FastAPI()
-
-origins = ["*"]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
+@cache
+def _get_exllama_generator():
+    """Load the model, tokenizers and loras on first use.
 
+    Importing exllamav2 and loading the model takes seconds and GBs of GPU
+    memory, so it is deferred until an endpoint actually needs it.
+    """
+    from exllamav2 import (
+        ExLlamaV2,
+        ExLlamaV2Config,
+        ExLlamaV2Cache,
+        ExLlamaV2Tokenizer,
+        ExLlamaV2Lora,
+    )
+    from exllamav2.generator import ExLlamaV2BaseGenerator
+    from transformers import AutoTokenizer
 
+    config = ExLlamaV2Config(MODEL_PATH)
+    model = ExLlamaV2(config)
+    model.load()
+    tokenizer = ExLlamaV2Tokenizer(config)
+    generator = ExLlamaV2BaseGenerator(model, ExLlamaV2Cache(model), tokenizer)
+    tokenizer_for_template = AutoTokenizer.from_pretrained(MODEL_PATH)
 
+    lora_add = ExLlamaV2Lora.from_directory(model, LORA_ADD_PATH)
+    lora_split = ExLlamaV2Lora.from_directory(model, LORA_SPLIT_PATH)
 
+    return generator, tokenizer_for_template, lora_add, lora_split
 
 
+@asynccontextmanager
+async def _lifespan(app):
+    # Set USE_EXLLAMA=1 to pay the load cost at startup instead of on the
+    # first request.
+    if os.getenv("USE_EXLLAMA"):
+        _get_exllama_generator()
+    yield
 
 
+app = create_app(lifespan=_lifespan)
 
 
 def create_prompt(text: str):
@@ -60,39 +67,36 @@ def create_prompt(text: str):
         }
     ]
 
+# "<word...> <emoji>": everything up to the last run of whitespace is the
+# word, the final non-space token is the emoji.
+_WORD_EMOJI = re.compile(r"\s*(.*?)\s+(\S+)\s*$")
+
+
+def _word_emoji(text):
+    m = _WORD_EMOJI.match(text)
+    if m is None:
+        return {"symbol": text.strip(), "emoji": ""}
+    return {"symbol": m.group(1), "emoji": m.group(2)}
+
 def convert_response(response):
     word_emoji = response[:-1].split(" [/INST] ")[-1]
-    word, emoji = word_emoji.rsplit(" ", 1)
-    return {
-        "symbol": word,
-        "emoji": emoji,
-    }
+    return _word_emoji(word_emoji)
 
 def convert_inverse_response(response):
     word_emojis = response[:-1].split(" [/INST] ")[-1]
-    split = list()
-    for word_emoji in word_emojis.split("+", 1):
-        word, emoji = word_emoji.rsplit(" ", 1)
-        split.append({
-            "symbol": word,
-            "emoji": emoji,
-        })
-    return split
-
-lora_split_path = "../loras/infini_craft/infini_craft_llama7b_gptq_lora_split"
-lora_split = ExLlamaV2Lora.from_directory(model, lora_split_path)
-
-lora_add_path = "../loras/infini_craft/infini_craft_llama7b_gptq_lora_add"
-lora_add = ExLlamaV2Lora.from_directory(model, lora_add_path)
-
-@lru_cache
+    return [_word_emoji(word_emoji) for word_emoji in word_emojis.split("+", 1)]
+
+@lru_cache(maxsize=16384)
 def _add(symbols: tuple[str]):
+    from exllamav2.generator import ExLlamaV2Sampler
+
+    generator, tokenizer_for_template, lora_add, _ = _get_exllama_generator()
     conversation = create_prompt("+".join(symbols))
     converted = tokenizer_for_template.apply_chat_template(conversation, tokenize=False)
 
 
     settings = ExLlamaV2Sampler.Settings(temperature=0)
-    generated = simple_generator.generate_simple(
+    generated = generator.generate_simple(
         converted,
         settings,
         30,
@@ -102,16 +106,16 @@ def _add(symbols: tuple[str]):
     )
 
     parsed = convert_response(generated)
-    print(f"got response: {parsed}")
+    log.debug("add symbols=%s parsed=%s", symbols, parsed)
     return parsed
 
 @app.get("/add")
 async def add(symbols: Annotated[list[str], Query()]):
-    print(f"got add request: {symbols}")
+    log.debug("got add request: %s", symbols)
     try:
         return _add(tuple(symbols))
-    except Exception as e:
-        print(traceback.format_exc())
+    except Exception:
+        log.exception("add failed symbols=%s", symbols)
     
     return {
         "symbol": "",
@@ -119,13 +123,16 @@ async def add(symbols: Annotated[list[str], Query()]):
     }
 
 
-@lru_cache
+@lru_cache(maxsize=16384)
 def _split(symbol: str):
+    from exllamav2.generator import ExLlamaV2Sampler
+
+    generator, tokenizer_for_template, _, lora_split = _get_exllama_generator()
     conversation = create_prompt(symbol)
     converted = tokenizer_for_template.apply_chat_template(conversation, tokenize=False)
 
     settings = ExLlamaV2Sampler.Settings(temperature=0)
-    generated = simple_generator.generate_simple(
+    generated = generator.generate_simple(
         converted,
         settings,
         30,
@@ -135,17 +142,17 @@ def _split(symbol: str):
     )
 
     parsed = convert_inverse_response(generated)
-    print(f"got response: {parsed}")
+    log.debug("split symbol=%s parsed=%s", symbol, parsed)
     return parsed
 
 
 @app.get("/split")
 async def split(symbol: str):
-    print(f"got split request: {symbol}")
+    log.debug("got split request: %s", symbol)
     try:
         return _split(symbol)
-    except Exception as e:
-        print(traceback.format_exc())
+    except Exception:
+        log.exception("split failed symbol=%s", symbol)
     
     return [{
             "symbol": "",
@@ -4,262 +4,490 @@ Run with: `uvicorn infini_craft.server_groq:app --reload`
 """
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
-from pathlib import Path
-import traceback
-import json
-from functools import lru_cache
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from typing import List, Annotated
-from pydantic import BaseModel
+import diskcache
+import httpx
+from pydantic import BaseModel, Field
+
+from fastapi import Header, Query
+from openai import AsyncOpenAI
+
+from infini_craft._common import (
+    ADD_BATCH_RESPONSE_FORMAT,
+    ADD_RESPONSE_FORMAT,
+    SPLIT_RESPONSE_FORMAT,
+    create_add_batch_prompt,
+    create_add_prompt,
+    create_app,
+    create_split_prompt,
+    load_api_key,
+    parse_add_batch_response,
+    parse_add_response,
+    parse_split_response,
+)
 
-from fastapi import FastAPI, Query
-from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI, BadRequestError
+log = logging.getLogger(__name__)
 
 # -----------------------------------------------------------------------------
 # Groq client configuration
 # -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Configuration helpers
-# -----------------------------------------------------------------------------
+# One pooled HTTP/2 client for every Groq call, so bursts reuse warm
+# connections instead of paying a fresh TCP+TLS handshake.
+_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(
+        max_connections=128,
+        max_keepalive_connections=64,
+        keepalive_expiry=60,
+    ),
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
 
-def _load_api_key() -> str:
-    """Return Groq API key.
+client = AsyncOpenAI(
+    base_url="https://api.groq.com/openai/v1",
+    api_key=load_api_key(),
+    http_client=_http,
+)
+MODEL_NAME = "qwen/qwen3-32b"
 
-    Looks for a file named `groq_api_key.txt` in the same directory as this script.
-    Fallback to `GROQ_API_KEY` env var if the file is missing or empty.
-    The file should contain only the plain API key string with no extra whitespace.
-    """
-    cfg_path = Path(__file__).with_name("groq_api_key.txt")
-    if cfg_path.exists():
-        key = cfg_path.read_text(encoding="utf-8").strip()
-        if key:
-            return key
-    return os.getenv("GROQ_API_KEY", "")
+# Treat "Water"+"Fire" and "Fire"+"Water" as the same combination so both
+# orders share a cache entry. Set INFINI_CRAFT_SORT_ADD=0 if the model turns
+# out to give order-dependent answers.
+SORT_ADD_SYMBOLS = os.getenv("INFINI_CRAFT_SORT_ADD", "1") != "0"
 
+# Add/split replies are tiny JSON objects, so keep the token reservation
+# small; Groq schedules requests on `max_tokens`. Custom prompts may ask for
+# larger JSON, so they get more room.
+MAX_TOKENS = 128
+CUSTOM_MAX_TOKENS = 1024
 
-API_KEY = _load_api_key()
+# `/add` requests carrying the same X-Client-Id that arrive within this many
+# seconds of each other are sent to Groq together via `_add_batch`.
+COALESCE_WINDOW = 0.005
 
-client = OpenAI(
-    base_url="https://api.groq.com/openai/v1",
-    api_key=API_KEY,
-)
-MODEL_NAME = "qwen/qwen3-32b"
+# Largest number of groups sent to Groq in one batch call; bigger batches
+# are split. `max_tokens` scales with the batch, so this keeps it well under
+# the model's output limit. /add_batch itself accepts up to MAX_BATCH_PAIRS.
+BATCH_SIZE = 16
+MAX_BATCH_PAIRS = 256
 
-# -----------------------------------------------------------------------------
-# FastAPI boilerplate
-# -----------------------------------------------------------------------------
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+@asynccontextmanager
+async def _lifespan(app):
+    yield
+    await _http.aclose()
+
+
+app = create_app(lifespan=_lifespan)
 
 # -----------------------------------------------------------------------------
 # Helper functions
 # -----------------------------------------------------------------------------
 
-def chat(
+async def _read_json_object(stream) -> str:
+    """Collect streamed content until the top-level JSON object closes.
+
+    Braces inside string values are ignored. Anything the model would have
+    sent after the closing brace (whitespace, EOS) is never waited for.
+    """
+    buf = []
+    depth = 0
+    in_string = False
+    escaped = False
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        piece = chunk.choices[0].delta.content
+        if not piece:
+            continue
+        for i, ch in enumerate(piece):
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+                if depth == 0:
+                    buf.append(piece[: i + 1])
+                    return "".join(buf).strip()
+        buf.append(piece)
+    return "".join(buf).strip()
+
+
+async def chat(
     messages: List[dict],
     temperature: float = 0.0,
-    max_tokens: int = 30000,  # Increased for safer JSON generation
-    json_mode: bool = False,
+    max_tokens: int = MAX_TOKENS,
+    response_format: dict | None = None,
 ) -> str:
-    """Call Groq ChatCompletion and return assistant content."""
-    kwargs = {}
-    if json_mode:
-        # Force the model to return a valid JSON object. Groq follows the same
-        # `response_format` parameter semantics as the OpenAI API.
-        kwargs["response_format"] = {"type": "json_object"}
+    """Call Groq ChatCompletion and return assistant content.
 
-    try:
-        completion = client.chat.completions.create(
+    Awaits the async client so the event loop keeps serving other requests
+    during the Groq round-trip. Without a `response_format` the reply is
+    streamed and the stream is closed as soon as the top-level JSON object
+    is complete; Groq doesn't support streaming with structured outputs, so
+    schema-constrained calls wait for the whole (small) reply instead.
+    """
+    # qwen3 thinks out loud by default, which would eat the small token
+    # budget before any JSON is emitted.
+    extra_body = {"reasoning_effort": "none"}
+
+    # With a strict schema the decoder can only produce valid output, so a
+    # failure here is a real error rather than something a text-mode retry
+    # could rescue; let it propagate to the endpoint.
+    if response_format is not None:
+        # Constrain the reply to a JSON schema. Groq follows the same
+        # `response_format` parameter semantics as the OpenAI API.
+        completion = await client.chat.completions.create(
             model=MODEL_NAME,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            **kwargs,
+            response_format=response_format,
+            extra_body=extra_body,
         )
-    except BadRequestError as e:
-        # Groq returns a 400 with code 'json_validate_failed' when the model
-        # fails to satisfy the strict JSON requirement. Fallback by retrying
-        # without the response_format constraint so that we still get a reply
-        # that we can attempt to parse heuristically.
-        if json_mode:
-            print(f"[chat] JSON mode failed, retrying in text mode: {e}")
-            completion = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-        else:
-            raise
-
-    return completion.choices[0].message.content.strip()
-
-
-def create_add_prompt(symbols: List[str]) -> List[dict]:
-    """Prompt Groq to combine symbols and return JSON {"symbol": str, "emoji": str}."""
-    joined = "+".join(symbols)
-    user_msg = f'''Combine the following symbols: {joined}
-
-Return a single JSON object with two keys: "symbol" and "emoji". Do not add any other text.
-
-Example for "Water" + "Fire":
-{{
-  "symbol": "Steam",
-  "emoji": "💨"
-}}'''
-    return [
-        {"role": "system", "content": "You are an API that returns JSON."},
-        {"role": "user", "content": user_msg},
-    ]
-
-
-def create_split_prompt(symbol: str) -> List[dict]:
-    """Prompt Groq to split a symbol and return JSON {"parts": [ {symbol, emoji}, {symbol, emoji} ]}."""
-    user_msg = f'''Split the following symbol into two parts: {symbol}
-
-Return a single JSON object with one key: "parts". The value should be a list of two objects, each with "symbol" and "emoji" keys. Do not add any other text.
-
-Example for "Steam":
-{{
-  "parts": [
-    {{
-      "symbol": "Water",
-      "emoji": "💧"
-    }},
-    {{
-      "symbol": "Fire",
-      "emoji": "🔥"
-    }}
-  ]
-}}'''
-    return [
-        {"role": "system", "content": "You are an API that returns JSON."},
-        {"role": "user", "content": user_msg},
-    ]
-
-
-def parse_add_response(text: str):
-    """Parse JSON response for add. Extract only the 'appearance' field."""
-    # Extract JSON from markdown response
-    import re
-    json_match = re.search(r'\[.*\{.*\}.*\]', text, re.DOTALL)
-    if json_match:
-        text = json_match.group(0)
-    
-    print(f"Extracted JSON: {text}")
-    print(f"Raw response text: {text}")  # Add debug logging
-    # Try parsing as a single JSON array
-    try:
-        data = json.loads(text)
-        print(f"Parsed JSON data: {data}")  # Add debug logging
-        if isinstance(data, list):
-            # Extract the first appearance string from each character object
-            appearances = []
-            for char in data:
-                if isinstance(char, dict) and 'appearance' in char and isinstance(char['appearance'], list) and len(char['appearance']) > 0:
-                    appearances.append(char['appearance'][0])
-                else:
-                    appearances.append('')
-            return appearances
-    except json.JSONDecodeError:
-        pass
-    
-    # Try parsing as a single JSON object and wrap it in a list
+        return completion.choices[0].message.content.strip()
+
+    stream = await client.chat.completions.create(
+        model=MODEL_NAME,
+        messages=messages,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True,
+        extra_body=extra_body,
+    )
     try:
-        data = json.loads(text)
-        if isinstance(data, dict):
-            return parse_add_response(json.dumps([data]))
-    except json.JSONDecodeError:
-        pass
-    
-    # Try parsing as multiple JSON objects separated by newlines
+        return await _read_json_object(stream)
+    finally:
+        await stream.close()
+
+
+# -----------------------------------------------------------------------------
+# Caching wrappers
+# -----------------------------------------------------------------------------
+
+# Finished results live in a bounded LRU (an OrderedDict, least recently used
+# first); requests that are still waiting on Groq live in `*_inflight`. A
+# second caller for a key that is in flight awaits the task already fetching
+# it instead of issuing its own Groq call.
+# No lock is needed because everything runs on the one event loop.
+#
+# Behind the LRU sits an on-disk cache so results survive uvicorn reloads.
+# Completions run at temperature 0, so a stored result stays valid.
+#
+# Keys are normalized (stripped, lowercased, and sorted for add), so "Water"
+# and "water " share an entry. The model is still prompted with the symbols
+# as the first caller typed them, and its reply is cached with the casing it
+# returned.
+CACHE_SIZE = 16384
+
+_disk = diskcache.Cache("./.infini_cache", size_limit=2**30)
+
+_add_results: OrderedDict = OrderedDict()
+_add_inflight: dict[tuple[str, ...], asyncio.Future] = {}
+_split_results: OrderedDict = OrderedDict()
+_split_inflight: dict[str, asyncio.Future] = {}
+# Running batch fills, referenced so they aren't garbage collected.
+_batch_tasks: set[asyncio.Task] = set()
+
+
+def _remember(results: OrderedDict, key, value) -> None:
+    results[key] = value
+    if len(results) > CACHE_SIZE:
+        results.popitem(last=False)
+
+
+def _settle(future: asyncio.Future, outcome) -> None:
+    """Resolve `future` with `outcome`, a result or an exception instance."""
+    if future.done():
+        return
+    if isinstance(outcome, asyncio.CancelledError):
+        future.cancel()
+    elif isinstance(outcome, BaseException):
+        future.set_exception(outcome)
+    else:
+        future.set_result(outcome)
+
+
+def _forget_inflight(inflight: dict, key, task: asyncio.Future) -> None:
+    if inflight.get(key) is task:
+        del inflight[key]
+    # Mark the exception as retrieved in case every caller had gone away.
+    if not task.cancelled():
+        task.exception()
+
+
+def _cached(namespace: str, results: OrderedDict, key):
+    """Return the finished result for `key` from memory or disk, else None."""
     try:
-        objects = []
-        for line in text.split('\n'):
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-                objects.append(obj)
-            except json.JSONDecodeError:
-                pass
-        if objects:
-            return parse_add_response(json.dumps(objects))
-    except Exception:
+        result = results[key]
+    except KeyError:
         pass
-    
-    # Fallback: try legacy parsing
-    try:
-        return parse_legacy_response(text)
-    except Exception:
-        return []
-
+    else:
+        results.move_to_end(key)
+        return result
+    stored = _disk.get((namespace, key))
+    if stored is not None:
+        _remember(results, key, stored)
+    return stored
 
-def parse_legacy_response(text: str):
-    """Parse legacy '+' format and return array of symbols (appearances)."""
-    parts = text.split("+")
-    result = []
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        try:
-            word, emoji = part.rsplit(" ", 1)
-        except ValueError:
-            word, emoji = part, ""
-        result.append(word.strip())
-    return result
 
+def _store(namespace: str, results: OrderedDict, key, value) -> None:
+    _remember(results, key, value)
+    _disk.set((namespace, key), value)
 
-def parse_split_response(text: str):
-    """Parse JSON response for split. Fallback to legacy '+' format."""
-    try:
-        data = json.loads(text)
-        if isinstance(data, dict) and "parts" in data and isinstance(data["parts"], list):
-            result = []
-            for item in data["parts"][:2]:
-                if isinstance(item, dict):
-                    result.append({
-                        "symbol": str(item.get("symbol", "")).strip(),
-                        "emoji": str(item.get("emoji", "")).strip(),
-                    })
-            # pad to 2
-            while len(result) < 2:
-                result.append({"symbol": "", "emoji": ""})
-            return result[:2]
-    except Exception:
-        pass  # fallback
 
-    # Legacy '+' parsing
-    return parse_legacy_response(text)
+async def _fill(namespace: str, results: OrderedDict, key, compute):
+    result = await compute()
+    _store(namespace, results, key, result)
+    return result
 
-# -----------------------------------------------------------------------------
-# Caching wrappers
-# -----------------------------------------------------------------------------
 
-@lru_cache
-def _add(symbols: tuple[str]):
-    response_text = chat(create_add_prompt(list(symbols)), json_mode=True)
+async def _single_flight(
+    namespace: str, results: OrderedDict, inflight: dict, key, compute
+):
+    result = _cached(namespace, results, key)
+    if result is not None:
+        return result
+
+    # The Groq call runs in its own task and every caller, including the
+    # first, awaits it through `shield`, so one client disconnecting only
+    # cancels its own wait and never the work others are waiting on.
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fill(namespace, results, key, compute))
+        inflight[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(inflight, key, t))
+    return await asyncio.shield(task)
+
+
+async def _compute_add(symbols: tuple[str, ...]):
+    response_text = await chat(
+        create_add_prompt(list(symbols)),
+        max_tokens=MAX_TOKENS,
+        response_format=ADD_RESPONSE_FORMAT,
+    )
     parsed = parse_add_response(response_text)
-    print(f"add symbols={symbols} response='{response_text}' parsed={parsed}")
+    log.debug("add symbols=%s response=%r parsed=%s", symbols, response_text, parsed)
     return parsed
 
 
-@lru_cache
-def _split(symbol: str):
-    response_text = chat(create_split_prompt(symbol), json_mode=True)
+async def _compute_split(symbol: str):
+    response_text = await chat(
+        create_split_prompt(symbol),
+        max_tokens=MAX_TOKENS,
+        response_format=SPLIT_RESPONSE_FORMAT,
+    )
     parsed = parse_split_response(response_text)
-    print(f"split symbol={symbol} response='{response_text}' parsed={parsed}")
+    log.debug("split symbol=%s response=%r parsed=%s", symbol, response_text, parsed)
+    return parsed
+
+
+async def _compute_add_batch(groups: List[tuple[str, ...]]):
+    response_text = await chat(
+        create_add_batch_prompt(groups),
+        max_tokens=MAX_TOKENS * len(groups),
+        response_format=ADD_BATCH_RESPONSE_FORMAT,
+    )
+    parsed = parse_add_batch_response(response_text)
+    log.debug("add_batch groups=%s response=%r parsed=%s", groups, response_text, parsed)
     return parsed
 
+
+def _add_key(symbols: tuple[str, ...]) -> tuple[str, ...]:
+    normalized = tuple(s.strip().lower() for s in symbols)
+    return tuple(sorted(normalized)) if SORT_ADD_SYMBOLS else normalized
+
+
+def _split_key(symbol: str) -> str:
+    return symbol.strip().lower()
+
+
+async def _add(symbols: tuple[str, ...]):
+    return await _single_flight(
+        "add", _add_results, _add_inflight, _add_key(symbols),
+        lambda: _compute_add(symbols),
+    )
+
+
+async def _fill_add_batch(
+    keys: List[tuple[str, ...]],
+    groups: List[tuple[str, ...]],
+    futures: List[asyncio.Future],
+):
+    try:
+        parsed = await _compute_add_batch(groups)
+    except BaseException as e:
+        for future in futures:
+            _settle(future, e)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return
+
+    # Match results to groups by the symbols the model echoed back, never by
+    # position, so a reordered or short reply can't cache the wrong answer.
+    by_key: dict = {}
+    for symbols, result in parsed:
+        by_key.setdefault(_add_key(symbols), result)
+    skipped = []
+    for key, group, future in zip(keys, groups, futures):
+        result = by_key.get(key)
+        if result is None:
+            skipped.append((key, group, future))
+            continue
+        _store("add", _add_results, key, result)
+        future.set_result(result)
+    if not skipped:
+        return
+
+    # The model skipped or garbled these groups; ask for each on its own,
+    # concurrently, after everything it did answer has been handed out.
+    log.debug(
+        "add_batch missing results for %s, retrying alone",
+        [group for _, group, _ in skipped],
+    )
+    try:
+        outcomes = await asyncio.gather(
+            *(_compute_add(group) for _, group, _ in skipped),
+            return_exceptions=True,
+        )
+    except asyncio.CancelledError:
+        for _, _, future in skipped:
+            future.cancel()
+        raise
+    for (key, _, future), outcome in zip(skipped, outcomes):
+        if not isinstance(outcome, BaseException):
+            _store("add", _add_results, key, outcome)
+        _settle(future, outcome)
+
+
+async def _add_batch(
+    groups: List[tuple[str, ...]]
+) -> List[dict | BaseException]:
+    """Resolve many symbol groups, sending cache misses to Groq in batches.
+
+    Misses go out in chunks of at most BATCH_SIZE groups per Groq call,
+    each in its own task so that a caller going away doesn't abort work
+    other requests are waiting on. Each result is stored under its own key,
+    so later `/add` requests for the same groups are cache hits. Keys
+    already in flight are awaited rather than asked for again.
+
+    A group that failed gets its exception in its slot instead of a result,
+    so one bad group doesn't sink the others.
+    """
+    keys = [_add_key(group) for group in groups]
+    unique: dict = {}
+    for key, group in zip(keys, groups):
+        unique.setdefault(key, group)
+
+    found: dict = {}
+    waiting: dict = {}
+    missing: List[tuple[str, ...]] = []
+    for key in unique:
+        result = _cached("add", _add_results, key)
+        if result is not None:
+            found[key] = result
+        elif key in _add_inflight:
+            waiting[key] = _add_inflight[key]
+        else:
+            missing.append(key)
+
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(missing), BATCH_SIZE):
+        chunk = missing[i : i + BATCH_SIZE]
+        futures = [loop.create_future() for _ in chunk]
+        for key, future in zip(chunk, futures):
+            _add_inflight[key] = future
+            future.add_done_callback(
+                lambda f, key=key: _forget_inflight(_add_inflight, key, f)
+            )
+        waiting.update(zip(chunk, futures))
+        task = asyncio.ensure_future(
+            _fill_add_batch(chunk, [unique[key] for key in chunk], futures)
+        )
+        _batch_tasks.add(task)
+        task.add_done_callback(_batch_tasks.discard)
+
+    outcomes = await asyncio.gather(
+        *(asyncio.shield(future) for future in waiting.values()),
+        return_exceptions=True,
+    )
+    found.update(zip(waiting, outcomes))
+    return [found[key] for key in keys]
+
+
+# Per-client buffers of (symbols, Future) waiting for the coalescing window to
+# close. `_flush_tasks` keeps a reference to running flushes so they aren't
+# garbage collected mid-flight.
+_add_windows: dict[str, List[tuple[tuple[str, ...], asyncio.Future]]] = {}
+_flush_tasks: set[asyncio.Task] = set()
+
+
+async def _flush_add_window(client_id: str):
+    waiting = _add_windows.pop(client_id)
+    groups = [symbols for symbols, _ in waiting]
+    # Each waiter gets its own group's outcome, so one failing group doesn't
+    # blank the rest of the window. `_settle` skips waiters that were
+    # cancelled (client disconnected) while the window was open.
+    try:
+        if len({_add_key(group) for group in groups}) == 1:
+            # Only one distinct combination (e.g. "M+N" and "N+M"); a
+            # plain `_add` is cheaper than a one-group batch prompt.
+            try:
+                outcome = await _add(groups[0])
+            except Exception as e:
+                outcome = e
+            outcomes = [outcome] * len(groups)
+        else:
+            outcomes = await _add_batch(groups)
+    except asyncio.CancelledError:
+        for _, future in waiting:
+            future.cancel()
+        raise
+    for (_, future), outcome in zip(waiting, outcomes):
+        _settle(future, outcome)
+
+
+def _start_flush(client_id: str):
+    task = asyncio.ensure_future(_flush_add_window(client_id))
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
+
+
+async def _add_coalesced(client_id: str, symbols: tuple[str, ...]):
+    """Queue `symbols` with this client's other `/add` calls from the same window."""
+    result = _cached("add", _add_results, _add_key(symbols))
+    if result is not None:
+        return result
+
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    waiting = _add_windows.get(client_id)
+    if waiting is None:
+        waiting = _add_windows[client_id] = []
+        loop.call_later(COALESCE_WINDOW, _start_flush, client_id)
+    waiting.append((symbols, future))
+    return await future
+
+
+async def _split(symbol: str):
+    return await _single_flight(
+        "split", _split_results, _split_inflight, _split_key(symbol),
+        lambda: _compute_split(symbol),
+    )
+
 # -----------------------------------------------------------------------------
 # API endpoints
 
@@ -277,26 +505,56 @@ class SplitCustomRequest(BaseModel):
     symbol: str
 
 
+class AddBatchRequest(BaseModel):
+    pairs: List[List[str]] = Field(max_length=MAX_BATCH_PAIRS)
+
+
 # -----------------------------------------------------------------------------
 # API endpoints
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
 @app.get("/add")
-async def add(symbols: Annotated[List[str], Query()]):
+async def add(
+    symbols: Annotated[List[str], Query()],
+    x_client_id: Annotated[str | None, Header()] = None,
+):
     try:
-        return _add(tuple(symbols))
+        if x_client_id:
+            return await _add_coalesced(x_client_id, tuple(symbols))
+        return await _add(tuple(symbols))
     except Exception:
-        print(traceback.format_exc())
+        log.exception("add failed symbols=%s", symbols)
         return {"symbol": "", "emoji": ""}
 
 
+@app.post("/add_batch")
+async def add_batch(req: AddBatchRequest):
+    """Combine many symbol groups at once; results come back in request order.
+
+    A group that fails gets an empty placeholder; the others still return
+    their real results.
+    """
+    try:
+        outcomes = await _add_batch([tuple(pair) for pair in req.pairs])
+    except Exception:
+        log.exception("add_batch failed pairs=%s", req.pairs)
+        return [{"symbol": "", "emoji": ""} for _ in req.pairs]
+    results = []
+    for pair, outcome in zip(req.pairs, outcomes):
+        if isinstance(outcome, BaseException):
+            log.error("add_batch failed symbols=%s", pair, exc_info=outcome)
+            outcome = {"symbol": "", "emoji": ""}
+        results.append(outcome)
+    return results
+
+
 @app.get("/split")
 async def split(symbol: str):
     try:
-        return _split(symbol)
+        return await _split(symbol)
     except Exception:
-        print(traceback.format_exc())
+        log.exception("split failed symbol=%s", symbol)
         return [{"symbol": "", "emoji": ""}, {"symbol": "", "emoji": ""}]
 
 
@@ -304,12 +562,19 @@ async def split(symbol: str):
 async def add_custom(req: AddCustomRequest):
     """Combine symbols with a fully custom prompt supplied by the client."""
     try:
-        response_text = chat(req.messages, json_mode=True)
+        response_text = await chat(
+            req.messages,
+            max_tokens=CUSTOM_MAX_TOKENS,
+            response_format=ADD_RESPONSE_FORMAT,
+        )
         parsed = parse_add_response(response_text)
-        print(f"add_custom symbols={req.symbols} response='{response_text}' parsed={parsed}")
+        log.debug(
+            "add_custom symbols=%s response=%r parsed=%s",
+            req.symbols, response_text, parsed,
+        )
         return parsed
     except Exception:
-        print(traceback.format_exc())
+        log.exception("add_custom failed symbols=%s", req.symbols)
         return {"symbol": "", "emoji": ""}
 
 
@@ -317,10 +582,17 @@ async def add_custom(req: AddCustomRequest):
 async def split_custom(req: SplitCustomRequest):
     """Split a symbol with a fully custom prompt supplied by the client."""
     try:
-        response_text = chat(req.messages, json_mode=True)
+        response_text = await chat(
+            req.messages,
+            max_tokens=CUSTOM_MAX_TOKENS,
+            response_format=SPLIT_RESPONSE_FORMAT,
+        )
         parsed = parse_split_response(response_text)
-        print(f"split_custom symbol={req.symbol} response='{response_text}' parsed={parsed}")
+        log.debug(
+            "split_custom symbol=%s response=%r parsed=%s",
+            req.symbol, response_text, parsed,
+        )
         return parsed
     except Exception:
-        print(traceback.format_exc())
+        log.exception("split_custom failed symbol=%s", req.symbol)
         return [{"symbol": "", "emoji": ""}, {"symbol": "", "emoji": ""}]
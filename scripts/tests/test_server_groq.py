@@ -0,0 +1,136 @@
+"""Tests for the `/add` caching and coalescing in `server_groq`.
+
+Groq is replaced by `fake_chat`, which answers batch prompts for every group
+except those containing "Bad" or "Slow". Single prompts then fail for "Bad",
+the way a model that skips a group and errors on the retry would, and answer
+late for "Slow".
+Run from the scripts directory with: `python -m unittest`
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import diskcache
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+from infini_craft import server_groq  # noqa: E402
+
+
+def _result(symbols):
+    return {"symbol": "+".join(symbols), "emoji": "x"}
+
+
+async def fake_chat(messages, **kwargs):
+    await asyncio.sleep(0.01)
+    content = messages[-1]["content"]
+    if content.startswith("Combine each"):
+        groups = [
+            line.split("+")
+            for line in re.findall(r"^\d+\. (.*)$", content, re.M)
+        ]
+        return json.dumps({
+            "results": [
+                {"symbols": group, **_result(group)}
+                for group in groups
+                if not re.search("Bad|Slow", "+".join(group))
+            ]
+        })
+    symbols = content.splitlines()[0].split(": ", 1)[1].split("+")
+    if "Bad" in symbols:
+        raise RuntimeError("groq failed")
+    if any(symbol.startswith("Slow") for symbol in symbols):
+        await asyncio.sleep(0.1)
+    return json.dumps(_result(symbols))
+
+
+class AddCoalescingTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        disk = diskcache.Cache(tmp.name)
+        self.addCleanup(disk.close)
+        for patcher in (
+            mock.patch.object(server_groq, "_disk", disk),
+            mock.patch.object(server_groq, "chat", fake_chat),
+            mock.patch.dict(server_groq._add_results, clear=True),
+            mock.patch.dict(server_groq._add_inflight, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_failed_group_only_fails_its_own_request(self):
+        with self.assertLogs(server_groq.log, "ERROR") as logs:
+            results = await asyncio.gather(
+                server_groq.add(["A", "B"], x_client_id="client"),
+                server_groq.add(["Bad", "X"], x_client_id="client"),
+                server_groq.add(["C", "D"], x_client_id="client"),
+            )
+        self.assertEqual(results, [
+            _result(["A", "B"]),
+            {"symbol": "", "emoji": ""},
+            _result(["C", "D"]),
+        ])
+        self.assertEqual(len(logs.records), 1)
+
+    async def test_cancelled_waiter_does_not_break_flush(self):
+        first, *rest = [
+            asyncio.ensure_future(
+                server_groq.add([f"A{i}", "B"], x_client_id="client")
+            )
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        first.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*rest), 1)
+        self.assertEqual(results, [_result(["A1", "B"]), _result(["A2", "B"])])
+        self.assertTrue(first.cancelled())
+
+
+    async def test_add_batch_keeps_results_of_groups_that_succeeded(self):
+        req = server_groq.AddBatchRequest(pairs=[["E", "F"], ["Bad", "X"]])
+        with self.assertLogs(server_groq.log, "ERROR"):
+            results = await server_groq.add_batch(req)
+        self.assertEqual(results, [
+            _result(["E", "F"]),
+            {"symbol": "", "emoji": ""},
+        ])
+
+
+    async def test_skipped_groups_do_not_delay_answered_groups(self):
+        groups = [("Slow1", "X"), ("Slow2", "X"), ("A", "B")]
+        batch = asyncio.ensure_future(server_groq._add_batch(groups))
+        await asyncio.sleep(0.05)
+        self.assertFalse(batch.done())
+        self.assertEqual(
+            await asyncio.wait_for(server_groq._add(("A", "B")), 0.01),
+            _result(["A", "B"]),
+        )
+        # The two retries run side by side, not one after the other.
+        self.assertEqual(
+            await asyncio.wait_for(batch, 0.15),
+            [_result(group) for group in groups],
+        )
+
+    async def test_window_with_one_distinct_group_uses_single_prompt(self):
+        with mock.patch.object(
+            server_groq, "chat", mock.AsyncMock(wraps=fake_chat)
+        ) as chat:
+            results = await asyncio.gather(
+                server_groq.add(["M", "N"], x_client_id="client"),
+                server_groq.add(["N", "M"], x_client_id="client"),
+            )
+        self.assertEqual(results, [_result(["M", "N"])] * 2)
+        chat.assert_awaited_once()
+        self.assertEqual(
+            chat.await_args.kwargs["response_format"],
+            server_groq.ADD_RESPONSE_FORMAT,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()